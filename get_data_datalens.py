@@ -10,7 +10,15 @@ from utils import (
     calc_skills, 
     calc_skills_from_description,
     process_frequency,
-    calc_typical_place)
+    calc_typical_place,
+    calc_vacancies_daily,
+    calc_skills_daily,
+    calc_salary_sketch,
+    merge_aggregates,
+    select_new_vacancies,
+    update_aggregated_ids,
+    read_aggregates,
+    write_aggregates)
 
 
 da = pd.read_csv('data/da.csv', parse_dates=['published_at'])
@@ -156,6 +164,25 @@ ds_typical_place = calc_typical_place(vacancies, 'ds', grades)
 da_typical_place.to_csv('data/da_typical_place.csv')
 ds_typical_place.to_csv('data/ds_typical_place.csv')
 
+# Обновляем накопленные агрегаты по дням публикации только вакансиями, которых ещё нет в хранилище
+stores = read_aggregates('data/aggregates')
+aggregated_ids = stores.get('aggregated_ids', pd.DataFrame({'id': pd.Series(dtype=int),
+                                                            'published_date': pd.Series(dtype=str)}))
+new_vacancies = select_new_vacancies(vacancies, aggregated_ids).astype({'published_date': str})
+
+deltas = {
+    'vacancies_daily': calc_vacancies_daily(new_vacancies),
+    'skills_daily': calc_skills_daily(new_vacancies),
+    'salary_daily': calc_salary_sketch(new_vacancies),
+}
+stores = {name: merge_aggregates(stores.get(name, delta.iloc[:0]), delta) for name, delta in deltas.items()}
+
+# Запоминаем учтенные вакансии, чтобы повторный запуск не удваивал счетчики
+stores['aggregated_ids'] = update_aggregated_ids(aggregated_ids, new_vacancies)
+
+# Счетчики и список учтенных вакансий сохраняются одной версией хранилища
+write_aggregates('data/aggregates', stores)
+
 # Разделяем навыки в столбце 'skills' и преобразуем DataFrame таким образом,
 # чтобы каждый навык был в отдельной строке
 vacancies['skills'] = vacancies['skills'].str.split(', ')
@@ -1,10 +1,12 @@
+import os
+import shutil
 import requests
 import re
 from tqdm import tqdm
 from time import sleep
 import pandas as pd
 import numpy as np
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 from pymystem3 import Mystem
 from yaml import load, FullLoader
 
@@ -455,4 +457,314 @@ def calc_typical_place(vacancies: pd.DataFrame, name_type: str, grades: Tuple) -
 
     
     
-    
\ No newline at end of file
+    
+
+# Параметр скетча зарплат: соседние корзины отличаются в SALARY_SKETCH_GAMMA раз,
+# поэтому относительная ошибка квантилей не превышает (gamma - 1) / (gamma + 1) ~ 1%
+SALARY_SKETCH_GAMMA = 1.02
+
+# Ключи агрегатов: день публикации, тип вакансии и грейд
+AGGREGATE_KEYS = ['published_date', 'name_type', 'experience']
+
+# Типы колонок хранилища: навыки читаются как строки, иначе навык 'null' или 'nan'
+# превратился бы при чтении в NaN и пропал бы при группировке
+AGGREGATE_DTYPES = {'published_date': str, 'name_type': str, 'experience': str,
+                    'skills': str, 'bucket': int, 'id': int, 'count': int}
+
+# Сколько дней хранить идентификаторы учтенных вакансий: выгрузка содержит только
+# активные вакансии примерно за последний месяц, поэтому более старые id не понадобятся
+AGGREGATED_IDS_HORIZON = 90
+
+
+def calc_vacancies_daily(vacancies: pd.DataFrame) -> pd.DataFrame:
+    """
+    Подсчитывает количество вакансий за каждый день публикации по типу вакансии и грейду.
+
+    Эти значения используются как знаменатель при расчете доли вакансий с навыком.
+
+    Parameters:
+    vacancies (pd.DataFrame): DataFrame с обработанными вакансиями.
+
+    Returns:
+    pd.DataFrame: Таблица с колонками AGGREGATE_KEYS и 'count'.
+    """
+    return vacancies.groupby(AGGREGATE_KEYS).size().reset_index(name='count')
+
+
+def calc_skills_daily(vacancies: pd.DataFrame) -> pd.DataFrame:
+    """
+    Подсчитывает количество вакансий с каждым навыком за каждый день публикации
+    по типу вакансии и грейду.
+
+    Учитываются только ключевые навыки из столбца 'skills_from_key_skills':
+    навыки из описания зависят от словаря SKILLS, который строится заново по каждой
+    выгрузке, и исказили бы сравнение разных периодов. Навыки стандартизируются
+    функцией process_frequency так же, как в data/skills.csv, каждый навык учитывается
+    в вакансии не более одного раза.
+
+    Parameters:
+    vacancies (pd.DataFrame): DataFrame с обработанными вакансиями и столбцом 'skills_from_key_skills'.
+
+    Returns:
+    pd.DataFrame: Таблица с колонками AGGREGATE_KEYS, 'skills' и 'count'.
+    """
+    skills = vacancies[['id'] + AGGREGATE_KEYS + ['skills_from_key_skills']]
+    skills = skills.rename(columns={'skills_from_key_skills': 'skills'})
+    skills['skills'] = skills['skills'].str.split(', ')
+    skills = skills.explode('skills').dropna(subset=['skills'])
+    skills = skills[skills['skills'] != '']
+    skills['skills'] = skills['skills'].map(process_frequency)
+    skills = skills.dropna(subset=['skills']).drop_duplicates(subset=['id', 'skills'])
+    return skills.groupby(AGGREGATE_KEYS + ['skills']).size().reset_index(name='count')
+
+
+def calc_salary_sketch(vacancies: pd.DataFrame) -> pd.DataFrame:
+    """
+    Строит скетч распределения зарплат за каждый день публикации по типу вакансии и грейду.
+
+    Зарплата в рублях попадает в логарифмическую корзину с номером
+    ceil(log(salary) / log(SALARY_SKETCH_GAMMA)). Скетчи разных дней и разных
+    выгрузок складываются простым суммированием счетчиков, поэтому квантили
+    за любой период считаются без обращения к исходным вакансиям.
+
+    Parameters:
+    vacancies (pd.DataFrame): DataFrame с обработанными вакансиями и столбцом 'salary_rub'.
+
+    Returns:
+    pd.DataFrame: Таблица с колонками AGGREGATE_KEYS, 'bucket' и 'count'.
+    """
+    salaries = vacancies[AGGREGATE_KEYS + ['salary_rub']].dropna(subset=['salary_rub'])
+    salaries = salaries[salaries['salary_rub'] > 0].copy()
+    salaries['bucket'] = np.ceil(
+        np.log(salaries['salary_rub'].astype(float)) / np.log(SALARY_SKETCH_GAMMA)
+    ).astype(int)
+    return salaries.groupby(AGGREGATE_KEYS + ['bucket']).size().reset_index(name='count')
+
+
+def select_new_vacancies(vacancies: pd.DataFrame, aggregated_ids: pd.DataFrame) -> pd.DataFrame:
+    """
+    Отбирает вакансии, которые ещё не учтены в хранилище агрегатов.
+
+    Идентификаторы хранятся только за последние AGGREGATED_IDS_HORIZON дней
+    до самой поздней учтенной даты публикации, поэтому более ранние вакансии
+    пропускаются: проверить, учтены ли они, уже нельзя.
+
+    Parameters:
+    vacancies (pd.DataFrame): DataFrame с обработанными вакансиями.
+    aggregated_ids (pd.DataFrame): Учтенные вакансии с колонками 'id' и 'published_date'.
+
+    Returns:
+    pd.DataFrame: Новые вакансии.
+    """
+    grid = ~vacancies.id.isin(aggregated_ids.id)
+    if not aggregated_ids.empty:
+        cutoff = (pd.to_datetime(aggregated_ids.published_date).max()
+                  - pd.Timedelta(days=AGGREGATED_IDS_HORIZON))
+        grid &= pd.to_datetime(vacancies.published_date) >= cutoff
+    return vacancies[grid]
+
+
+def update_aggregated_ids(aggregated_ids: pd.DataFrame, new_vacancies: pd.DataFrame) -> pd.DataFrame:
+    """
+    Добавляет новые вакансии к учтенным и удаляет идентификаторы старше
+    AGGREGATED_IDS_HORIZON дней, чтобы размер списка не рос вместе с историей.
+
+    Parameters:
+    aggregated_ids (pd.DataFrame): Учтенные вакансии с колонками 'id' и 'published_date'.
+    new_vacancies (pd.DataFrame): Новые вакансии.
+
+    Returns:
+    pd.DataFrame: Обновленный список учтенных вакансий.
+    """
+    ids = pd.concat((aggregated_ids, new_vacancies[['id', 'published_date']]), ignore_index=True)
+    if ids.empty:
+        return ids
+    dates = pd.to_datetime(ids.published_date)
+    return ids[dates >= dates.max() - pd.Timedelta(days=AGGREGATED_IDS_HORIZON)].reset_index(drop=True)
+
+
+def merge_aggregates(store: pd.DataFrame, delta: pd.DataFrame) -> pd.DataFrame:
+    """
+    Добавляет к накопленным агрегатам приращение от новой выгрузки.
+
+    Счетчики с одинаковыми ключами суммируются, новые ключи добавляются.
+
+    Parameters:
+    store (pd.DataFrame): Накопленные агрегаты.
+    delta (pd.DataFrame): Агрегаты, посчитанные только по новым вакансиям.
+
+    Returns:
+    pd.DataFrame: Обновленные агрегаты, отсортированные по ключам.
+    """
+    keys = [column for column in delta.columns if column != 'count']
+    return (pd.concat((store, delta))
+            .groupby(keys, as_index=False)['count'].sum()
+            .sort_values(by=keys)
+            .reset_index(drop=True))
+
+
+def read_aggregates(directory: str) -> Dict[str, pd.DataFrame]:
+    """
+    Загружает текущую версию хранилища агрегатов.
+
+    Файл CURRENT в каталоге directory содержит имя подкаталога с актуальной
+    версией, в котором каждая таблица хранится в отдельном CSV-файле.
+
+    Parameters:
+    directory (str): Каталог хранилища агрегатов.
+
+    Returns:
+    Dict[str, pd.DataFrame]: Таблицы хранилища по именам, пустой словарь если хранилища ещё нет.
+    """
+    pointer = os.path.join(directory, 'CURRENT')
+    if not os.path.exists(pointer):
+        return {}
+    with open(pointer) as f:
+        version = os.path.join(directory, f.read().strip())
+    return {
+        file[:-len('.csv')]: pd.read_csv(os.path.join(version, file),
+                                         keep_default_na=False, dtype=AGGREGATE_DTYPES)
+        for file in os.listdir(version) if file.endswith('.csv')
+    }
+
+
+def write_aggregates(directory: str, stores: Dict[str, pd.DataFrame]) -> None:
+    """
+    Атомарно сохраняет новую версию хранилища агрегатов.
+
+    Все таблицы записываются в новый подкаталог, после чего одним вызовом
+    os.replace подменяется файл CURRENT. Если запуск прервется до этого момента,
+    останется прежняя версия целиком, поэтому счетчики и список учтенных
+    вакансий не могут разойтись.
+
+    Parameters:
+    directory (str): Каталог хранилища агрегатов.
+    stores (Dict[str, pd.DataFrame]): Таблицы хранилища по именам.
+    """
+    version = pd.Timestamp.now().strftime('%Y%m%d%H%M%S%f')
+    os.makedirs(os.path.join(directory, version))
+    for name, table in stores.items():
+        table.to_csv(os.path.join(directory, version, name + '.csv'), index=False)
+
+    pointer = os.path.join(directory, 'CURRENT')
+    with open(pointer + '.tmp', 'w') as f:
+        f.write(version)
+    os.replace(pointer + '.tmp', pointer)
+
+    # Удаляем прежние версии и остатки прерванных запусков
+    for entry in os.listdir(directory):
+        path = os.path.join(directory, entry)
+        if entry != version and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def filter_aggregates(aggregates: pd.DataFrame, start, stop,
+                      name_type: Optional[str] = None,
+                      experience: Optional[str] = None) -> pd.DataFrame:
+    """
+    Отбирает агрегаты за дни публикации в полуинтервале [start, stop).
+
+    Parameters:
+    aggregates (pd.DataFrame): Агрегаты с колонкой 'published_date'.
+    start: Первый день периода.
+    stop: День, следующий за последним днем периода.
+    name_type (Optional[str]): Тип вакансии ('da' или 'ds'), по умолчанию все.
+    experience (Optional[str]): Грейд, по умолчанию все.
+
+    Returns:
+    pd.DataFrame: Агрегаты за выбранный период.
+    """
+    dates = pd.to_datetime(aggregates['published_date'])
+    grid = (dates >= pd.Timestamp(start)) & (dates < pd.Timestamp(stop))
+    if name_type is not None:
+        grid &= aggregates['name_type'] == name_type
+    if experience is not None:
+        grid &= aggregates['experience'] == experience
+    return aggregates[grid]
+
+
+def calc_salary_quantiles(salary_sketch: pd.DataFrame, quantiles: List[float]) -> pd.Series:
+    """
+    Вычисляет приближенные квантили зарплаты по скетчу.
+
+    Скетч заранее фильтруется функцией filter_aggregates по нужному периоду,
+    типу вакансии и грейду.
+
+    Parameters:
+    salary_sketch (pd.DataFrame): Скетч зарплат, построенный функцией calc_salary_sketch.
+    quantiles (List[float]): Уровни квантилей от 0 до 1.
+
+    Returns:
+    pd.Series: Квантили зарплаты в рублях, индекс - уровни квантилей.
+
+    Raises:
+    ValueError: Если уровень квантиля вне отрезка [0, 1].
+    """
+    if not all(0 <= q <= 1 for q in quantiles):
+        raise ValueError(f'Уровни квантилей должны быть от 0 до 1, получено: {quantiles}')
+
+    hist = salary_sketch.groupby('bucket')['count'].sum().sort_index()
+    if hist.empty:
+        return pd.Series(np.nan, index=quantiles)
+
+    # Ищем корзину, в которую попадает наблюдение с рангом q * (n - 1)
+    cumsum = hist.cumsum().to_numpy()
+    ranks = np.asarray(quantiles) * (cumsum[-1] - 1)
+    buckets = hist.index.to_numpy()[np.searchsorted(cumsum, ranks, side='right')]
+
+    # Оценка значения - середина корзины (gamma^(k-1), gamma^k]
+    values = 2 * SALARY_SKETCH_GAMMA ** buckets / (SALARY_SKETCH_GAMMA + 1)
+    return pd.Series(values, index=quantiles)
+
+
+def calc_rising_skills(skills_daily: pd.DataFrame, vacancies_daily: pd.DataFrame,
+                       date, window: int = 30, top: int = 10, min_count: int = 5,
+                       name_type: Optional[str] = None,
+                       experience: Optional[str] = None) -> pd.DataFrame:
+    """
+    Находит навыки, доля которых в вакансиях сильнее всего выросла.
+
+    Сравнивает долю вакансий с навыком за последние window дней до даты date
+    (не включая её) с долей за предыдущие window дней. Расчет ведется только
+    по агрегатам, без обращения к исходным вакансиям.
+
+    Parameters:
+    skills_daily (pd.DataFrame): Агрегаты навыков, построенные функцией calc_skills_daily.
+    vacancies_daily (pd.DataFrame): Агрегаты вакансий, построенные функцией calc_vacancies_daily.
+    date: День, следующий за последним днем текущего окна.
+    window (int): Длина окна в днях, например 30 или 90.
+    top (int): Количество навыков в результате.
+    min_count (int): Минимальное число вакансий с навыком в текущем окне.
+    name_type (Optional[str]): Тип вакансии ('da' или 'ds'), по умолчанию все.
+    experience (Optional[str]): Грейд, по умолчанию все.
+
+    Returns:
+    pd.DataFrame: Таблица с количеством и долей вакансий с навыком в текущем и
+    предыдущем окне и изменением доли, отсортированная по убыванию изменения.
+    Если в одном из окон нет вакансий, сравнивать не с чем и таблица пустая.
+    """
+    stop = pd.Timestamp(date)
+    middle = stop - pd.Timedelta(days=window)
+    start = middle - pd.Timedelta(days=window)
+    filters = dict(name_type=name_type, experience=experience)
+
+    table = pd.DataFrame({
+        'count_previous': filter_aggregates(skills_daily, start, middle, **filters)
+        .groupby('skills')['count'].sum(),
+        'count_current': filter_aggregates(skills_daily, middle, stop, **filters)
+        .groupby('skills')['count'].sum(),
+    }).fillna(0).astype(int)
+
+    # Нормируем на число вакансий в окне, чтобы рост рынка не выдавался за рост навыка
+    total_previous = filter_aggregates(vacancies_daily, start, middle, **filters)['count'].sum()
+    total_current = filter_aggregates(vacancies_daily, middle, stop, **filters)['count'].sum()
+    table['share_previous'] = table['count_previous'] / total_previous if total_previous else np.nan
+    table['share_current'] = table['count_current'] / total_current if total_current else np.nan
+    table['share_change'] = table['share_current'] - table['share_previous']
+
+    # Без вакансий в одном из окон базы для сравнения нет, и любой навык выглядел бы растущим
+    if not total_previous or not total_current:
+        return table.iloc[:0]
+
+    table = table[table['count_current'] >= min_count]
+    return table.sort_values(by='share_change', ascending=False).head(top)